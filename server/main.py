@@ -1,10 +1,15 @@
 from __future__ import annotations
 
-from fastapi import FastAPI
+from urllib.parse import quote_plus
+
+from fastapi import FastAPI, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
 
 from triage.run_and_triage import run_once
-from triage.storage import list_runs, get_run, compute_flaky_tests
+from triage.durations import duration_report
+from triage.flaky import analyze_flaky
+from triage.storage import MARK_END, MARK_START, list_runs, get_run, search_runs
+from triage.worker import worker_address
 
 app = FastAPI(title="AI CI Triage")
 
@@ -59,17 +64,34 @@ def home():
 
         <div class="card">
           <h2>Run tests</h2>
-          <form method="post" action="/run">
+          <form method="post" action="/run" style="display:inline;">
             <button class="btn" type="submit">Run tests now</button>
           </form>
+          <form method="post" action="/run" style="display:inline;">
+            <input type="hidden" name="worker" value="1">
+            <button class="btn" type="submit">Run on warm worker</button>
+          </form>
           <p style="color:#555;margin-top:10px;">
             If <code>OPENAI_API_KEY</code> is set, the system uses an LLM for triage; otherwise it falls back to rules.
           </p>
+          <p style="color:#555;">
+            Warm worker: <code>python -m triage.worker</code> listening on <code>{worker_address()}</code>
+            (falls back to a normal run if it isn't up).
+          </p>
           <p style="margin-top:10px;">
             <a class="btn" href="/flaky">View flaky tests</a>
+            <a class="btn" href="/durations">View slow tests</a>
           </p>
         </div>
 
+        <div class="card">
+          <h2>Search</h2>
+          <form method="get" action="/search">
+            <input type="text" name="q" placeholder="error message, test name, triage reason..." style="width:60%;padding:8px;">
+            <button class="btn" type="submit">Search</button>
+          </form>
+        </div>
+
         <div class="card">
           <h2>Recent runs</h2>
           <table>
@@ -89,25 +111,30 @@ def home():
     return HTMLResponse(html)
 
 @app.post("/run")
-def run_tests():
+def run_tests(worker: str = Form("")):
     # In production you'd do this async (Celery/RQ) to avoid blocking.
-    run_once()
+    run_once(worker=worker_address() if worker else None)
     return RedirectResponse(url="/", status_code=303)
 
 @app.get("/flaky", response_class=HTMLResponse)
-def flaky_page():
-    stats = compute_flaky_tests(window=30, min_occurrences=3)
+def flaky_page(window: int = 30, min_occurrences: int = 3):
+    window = max(1, min(int(window), 10000))
+    stats = analyze_flaky(window=window, min_occurrences=min_occurrences)
     flaky = [(t, s) for t, s in stats.items() if s.get("is_flaky")]
 
     rows = []
-    for t, s in sorted(flaky, key=lambda x: (-x[1]["runs"], -x[1]["fails"])):
+    for t, s in sorted(flaky, key=lambda x: (-x[1]["flip_rate"], -x[1]["decayed_fail_rate"], -x[1]["runs"])):
+        lo, hi = s["fail_rate_ci"]
         rows.append(f"""
         <tr>
           <td><code>{_escape_text(t)}</code></td>
           <td>{s['runs']}</td>
           <td>{s['fails']}</td>
           <td>{s['passes']}</td>
-          <td>{s['fail_rate']}</td>
+          <td>{s['fail_rate']} <span style="color:#777;">[{lo}, {hi}]</span></td>
+          <td>{s['decayed_fail_rate']}</td>
+          <td>{s['flip_rate']}</td>
+          <td>{s['max_fail_streak']} / {s['current_fail_streak']}</td>
         </tr>
         """)
 
@@ -130,21 +157,195 @@ def flaky_page():
         <h1>Flaky tests (heuristic)</h1>
         <div class="card">
           <p>
-            A test is marked <b>flaky</b> if, within the last 30 runs, it has both passes and failures
-            and appears in at least 3 runs.
+            A test is marked <b>flaky</b> if, within the last {window} runs, it has both passes and failures
+            and appears in at least {min_occurrences} runs.
+          </p>
+          <p style="color:#555;">
+            <b>Flip rate</b>: share of consecutive runs where the outcome changed.
+            <b>Decayed</b>: fail rate weighting recent runs more (half-life 10 runs).
+            Brackets show the 95% confidence interval of the fail rate.
           </p>
+          <form method="get" action="/flaky">
+            Window: <input type="number" name="window" value="{window}" min="1" max="10000">
+            <button type="submit">Apply</button>
+          </form>
         </div>
         <div class="card">
           <h2>Flaky list</h2>
           <table>
             <thead>
-              <tr><th>Test</th><th>Runs</th><th>Fails</th><th>Passes</th><th>Fail rate</th></tr>
+              <tr><th>Test</th><th>Runs</th><th>Fails</th><th>Passes</th><th>Fail rate</th><th>Decayed</th><th>Flip rate</th><th>Streak (max / current)</th></tr>
+            </thead>
+            <tbody>
+              {''.join(rows) if rows else '<tr><td colspan="8">No flaky tests detected yet. Run tests multiple times.</td></tr>'}
+            </tbody>
+          </table>
+        </div>
+      </body>
+    </html>
+    """
+    return HTMLResponse(html)
+
+@app.get("/api/durations")
+def durations_api(window: int = 20, limit: int = 25):
+    return duration_report(window=max(1, min(int(window), 1000)), limit=max(1, min(int(limit), 500)))
+
+@app.get("/durations", response_class=HTMLResponse)
+def durations_page(window: int = 20, limit: int = 25):
+    report = durations_api(window=window, limit=limit)
+
+    slow_rows = []
+    for s in report["slowest"]:
+        base = s["baseline_median"]
+        slow_rows.append(f"""
+        <tr>
+          <td><code>{_escape_text(s['test'])}</code></td>
+          <td>{s['duration']}</td>
+          <td>{base if base is not None else '-'}</td>
+        </tr>
+        """)
+
+    reg_rows = []
+    for s in report["regressed"]:
+        reg_rows.append(f"""
+        <tr>
+          <td><code>{_escape_text(s['test'])}</code></td>
+          <td>{s['duration']}</td>
+          <td>{s['baseline_median']}</td>
+          <td>+{s['delta']}</td>
+          <td>{f"{s['ratio']}x" if s['ratio'] is not None else '-'}</td>
+          <td>{s['z']}</td>
+        </tr>
+        """)
+
+    run_link = f'<a href="/runs/{report["run_id"]}">#{report["run_id"]}</a>' if report["run_id"] else "-"
+
+    html = f"""
+    <html>
+      <head>
+        <title>Slow Tests</title>
+        <style>
+          body {{ font-family: Arial, sans-serif; margin: 24px; }}
+          .card {{ border: 1px solid #ddd; border-radius: 12px; padding: 16px; margin-bottom: 18px; }}
+          table {{ border-collapse: collapse; width: 100%; }}
+          th, td {{ border-bottom: 1px solid #eee; padding: 10px; text-align: left; }}
+          th {{ background: #fafafa; }}
+          code {{ background:#f6f6f6; padding:2px 6px; border-radius:6px; }}
+          a {{ text-decoration:none; }}
+        </style>
+      </head>
+      <body>
+        <p><a href="/">← Back</a></p>
+        <h1>Slow tests</h1>
+        <div class="card">
+          <p>
+            Latest run with timings: {run_link}. A test is <b>regressed</b> if its duration is a robust outlier
+            (median/MAD z-score &ge; 4) against the previous {window} runs, at least 1.5x the median and 0.1s slower.
+            JSON: <code>/api/durations</code>
+          </p>
+        </div>
+        <div class="card">
+          <h2>Most regressed</h2>
+          <table>
+            <thead>
+              <tr><th>Test</th><th>Duration (s)</th><th>Baseline median (s)</th><th>Delta (s)</th><th>Ratio</th><th>z</th></tr>
             </thead>
             <tbody>
-              {''.join(rows) if rows else '<tr><td colspan="5">No flaky tests detected yet. Run tests multiple times.</td></tr>'}
+              {''.join(reg_rows) if reg_rows else '<tr><td colspan="6">No duration regressions detected.</td></tr>'}
             </tbody>
           </table>
         </div>
+        <div class="card">
+          <h2>Slowest</h2>
+          <table>
+            <thead>
+              <tr><th>Test</th><th>Duration (s)</th><th>Baseline median (s)</th></tr>
+            </thead>
+            <tbody>
+              {''.join(slow_rows) if slow_rows else '<tr><td colspan="3">No timings recorded yet. Run tests.</td></tr>'}
+            </tbody>
+          </table>
+        </div>
+      </body>
+    </html>
+    """
+    return HTMLResponse(html)
+
+@app.get("/api/search")
+def search_api(q: str = "", limit: int = 20, offset: int = 0):
+    limit = max(1, min(int(limit), 100))
+    offset = max(0, int(offset))
+    res = search_runs(q, limit=limit, offset=offset)
+    for r in res["results"]:
+        r["snippet_html"] = _highlight(r.pop("snippet"))
+    return {"query": q, "limit": limit, "offset": offset, **res}
+
+@app.get("/search", response_class=HTMLResponse)
+def search_page(q: str = "", page: int = 1):
+    per_page = 20
+    page = max(1, int(page))
+    res = search_api(q=q, limit=per_page, offset=(page - 1) * per_page)
+
+    rows = []
+    for r in res["results"]:
+        tri = r["triage"]
+        rows.append(f"""
+        <tr>
+          <td><a href="/runs/{r['id']}">{r['id']}</a></td>
+          <td>{r['created_at']}</td>
+          <td>{'✅' if r['ok'] else '❌'}</td>
+          <td>{_escape_text(str(tri.get('classification','')))}</td>
+          <td><pre style="white-space:pre-wrap;margin:0;">{r['snippet_html']}</pre></td>
+        </tr>
+        """)
+
+    pages = (res["total"] + per_page - 1) // per_page
+    q_url = quote_plus(q)
+    nav = []
+    if page > 1:
+        nav.append(f'<a href="/search?q={q_url}&page={page - 1}">← Prev</a>')
+    if page < pages:
+        nav.append(f'<a href="/search?q={q_url}&page={page + 1}">Next →</a>')
+
+    html = f"""
+    <html>
+      <head>
+        <title>Search</title>
+        <style>
+          body {{ font-family: Arial, sans-serif; margin: 24px; }}
+          .card {{ border: 1px solid #ddd; border-radius: 12px; padding: 16px; margin-bottom: 18px; }}
+          table {{ border-collapse: collapse; width: 100%; }}
+          th, td {{ border-bottom: 1px solid #eee; padding: 10px; text-align: left; vertical-align: top; }}
+          th {{ background: #fafafa; }}
+          mark {{ background: #ffe58a; }}
+          a {{ text-decoration:none; }}
+        </style>
+      </head>
+      <body>
+        <p><a href="/">← Back</a></p>
+        <h1>Search</h1>
+        <div class="card">
+          <form method="get" action="/search">
+            <input type="text" name="q" value="{_escape_attr(q)}" style="width:60%;padding:8px;">
+            <button type="submit">Search</button>
+          </form>
+          <p style="color:#555;">
+            Searches raw output, triage reason / root cause and failed test names. All terms must match.
+            JSON: <code>/api/search?q=...</code>
+          </p>
+        </div>
+        <div class="card">
+          <h2>{res['total']} result(s){f' — page {page} of {pages}' if pages > 1 else ''}</h2>
+          <table>
+            <thead>
+              <tr><th>ID</th><th>Time (UTC)</th><th>OK</th><th>Classification</th><th>Match</th></tr>
+            </thead>
+            <tbody>
+              {''.join(rows) if rows else '<tr><td colspan="5">No matches.</td></tr>'}
+            </tbody>
+          </table>
+          <p>{' &nbsp; '.join(nav)}</p>
+        </div>
       </body>
     </html>
     """
@@ -158,7 +359,7 @@ def run_detail(run_id: int):
 
     tri = r["triage"]
     failed = r.get("failed_tests", [])
-    flaky_stats = compute_flaky_tests(window=30, min_occurrences=3)
+    flaky_stats = analyze_flaky(window=30, min_occurrences=3)
     flaky_failed = [t for t in failed if flaky_stats.get(t, {}).get("is_flaky")]
 
     # tri_html = "<pre>" + _escape_json(tri) + "</pre>"
@@ -241,6 +442,12 @@ def run_detail(run_id: int):
 def _escape_text(s: str) -> str:
     return (s or "").replace("&","&amp;").replace("<","&lt;").replace(">","&gt;")
 
+def _escape_attr(s: str) -> str:
+    return _escape_text(s).replace('"', "&quot;")
+
+def _highlight(snippet: str) -> str:
+    return _escape_text(snippet).replace(MARK_START, "<mark>").replace(MARK_END, "</mark>")
+
 def _escape_json(obj) -> str:
     import json
     return _escape_text(json.dumps(obj, indent=2, ensure_ascii=False))
@@ -1,7 +1,11 @@
+import os
 import subprocess
 import re
-from dataclasses import dataclass
-from typing import List, Tuple
+import sys
+import tempfile
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
 
 @dataclass
 class PytestResult:
@@ -10,22 +14,32 @@ class PytestResult:
     return_code: int
     all_tests: List[str]
     failed_tests: List[str]
+    durations: Dict[str, float] = field(default_factory=dict)  # nodeid -> seconds
 
 _FAILED_RE = re.compile(r"^FAILED\s+([^\s]+)\s+-\s+", re.MULTILINE)
 
-def _run(cmd: List[str]) -> Tuple[int, str]:
+def _run(cmd: List[str], worker: Optional[str] = None) -> Tuple[int, str]:
+    # pytest commands can go to a warm worker (triage.worker); fall back to a
+    # fresh process if it isn't reachable.
+    if worker and cmd[0] == "pytest":
+        from triage.worker import run_remote
+
+        try:
+            return run_remote(cmd[1:], address=worker)
+        except OSError as e:
+            print(f"[collect] worker {worker} unavailable ({e}); running pytest locally", file=sys.stderr)
     proc = subprocess.run(cmd, capture_output=True, text=True)
     raw = (proc.stdout or "") + "\n" + (proc.stderr or "")
     return proc.returncode, raw
 
-def collect_all_tests() -> List[str]:
+def collect_all_tests(worker: Optional[str] = None) -> List[str]:
     """
     Collect all pytest nodeids (test identifiers) via --collect-only.
 
     This gives us the universe of tests so we can infer "pass" for tests that
     don't appear in the failed list for a given run.
     """
-    rc, raw = _run(["pytest", "--collect-only", "-q"])
+    rc, raw = _run(["pytest", "--collect-only", "-q"], worker=worker)
     # Typical lines contain nodeids like:
     #   app_under_test/test_buggy.py::test_divide_ok
     tests = []
@@ -45,16 +59,66 @@ def extract_failed_tests(pytest_output: str) -> List[str]:
     """
     return sorted(set(_FAILED_RE.findall(pytest_output or "")))
 
-def run_pytest() -> PytestResult:
+def _junit_key(nodeid: str) -> Tuple[str, str]:
+    """
+    Map a nodeid to the (classname, name) pair pytest writes to JUnit XML:
+      pkg/test_m.py::TestA::test_x  ->  ("pkg.test_m.TestA", "test_x")
+    Like pytest's mangle_test_address, "[params]" is split off first, since
+    parameter ids may themselves contain "::".
+    """
+    address, bracket, params = nodeid.partition("[")
+    path, *parts = address.split("::")
+    module = path[:-3] if path.endswith(".py") else path
+    module = module.replace("/", ".").replace("\\", ".")
+    if parts:
+        parts[-1] += bracket + params
+    return ".".join([module] + parts[:-1]), (parts[-1] if parts else "")
+
+def extract_durations(junit_xml_path: str, all_tests: List[str]) -> Dict[str, float]:
+    """
+    Read per-test durations (seconds) from a pytest --junitxml report.
+
+    JUnit XML only carries classname/name, so entries are matched back to the
+    collected nodeids; unmatched entries are dropped.
+    """
+    try:
+        root = ET.parse(junit_xml_path).getroot()
+    except (OSError, ET.ParseError):
+        return {}
+    by_key = {_junit_key(t): t for t in all_tests}
+    out: Dict[str, float] = {}
+    for case in root.iter("testcase"):
+        nodeid = by_key.get((case.get("classname", ""), case.get("name", "")))
+        if nodeid is None:
+            continue
+        try:
+            out[nodeid] = float(case.get("time") or 0.0)
+        except ValueError:
+            continue
+    return out
+
+def run_pytest(worker: Optional[str] = None) -> PytestResult:
     """
     Run pytest and capture raw output + derive:
       - all_tests: collected nodeids
       - failed_tests: failed nodeids for this run
+      - durations: per-test wall time (from a temporary JUnit XML report)
+
+    If `worker` ("host:port") is given, pytest runs on that warm worker
+    daemon instead of in fresh processes.
     """
-    all_tests = collect_all_tests()
-    rc, raw = _run(["pytest", "-q"])
+    all_tests = collect_all_tests(worker=worker)
+    fd, junit_path = tempfile.mkstemp(suffix=".xml")
+    os.close(fd)
+    try:
+        rc, raw = _run(["pytest", "-q", f"--junitxml={junit_path}"], worker=worker)
+        durations = extract_durations(junit_path, all_tests)
+    finally:
+        os.unlink(junit_path)
     failed = extract_failed_tests(raw)
     ok = (rc == 0)
 
     # If collection failed, we can still store failed tests.
-    return PytestResult(ok=ok, raw_output=raw, return_code=rc, all_tests=all_tests, failed_tests=failed)
+    return PytestResult(
+        ok=ok, raw_output=raw, return_code=rc, all_tests=all_tests, failed_tests=failed, durations=durations
+    )
@@ -3,6 +3,7 @@ from __future__ import annotations
 import json
 import os
 import re
+import time
 from typing import Any, Dict
 
 ALLOWED_CLASS = ["Code Bug","Environment Issue","Flaky Test","Unknown"]
@@ -45,6 +46,18 @@ def analyze_with_rules(pytest_output: str) -> Dict[str, Any]:
         "reason": "Not enough signal; needs human review."
     }
 
+def analyze_with_stub(pytest_output: str) -> Dict[str, Any]:
+    """
+    Local stand-in for an LLM backend (no network, no key).
+    Sleeps TRIAGE_STUB_LATENCY seconds (default 0.2) to mimic model latency,
+    then answers with the rules result in the LLM schema.
+    Handy for exercising the replay engine's async path.
+    """
+    time.sleep(float(os.getenv("TRIAGE_STUB_LATENCY", "0.2")))
+    obj = analyze_with_rules(pytest_output)
+    obj["root_cause_summary"] = obj["reason"]
+    return obj
+
 def _extract_json(text: str) -> Dict[str, Any] | None:
     m = re.search(r"\{.*\}", text, re.DOTALL)
     if not m:
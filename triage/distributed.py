@@ -0,0 +1,441 @@
+"""
+Multi-node test execution with a lease-based shard queue.
+
+The coordinator collects nodeids, splits them into shards (balanced by
+recorded durations when available) and serves them from a small TCP server.
+Workers lease a shard, run it with pytest, heartbeat while it runs and send
+the result back. A lease that is not renewed expires and the shard goes back
+to the queue; once the queue is empty, shards running much longer than the
+typical shard get a speculative duplicate, and the first result wins.
+
+The merged result is a normal PytestResult, so triage and storage can't tell
+it from a local run.
+
+    export TRIAGE_COORDINATOR_TOKEN=...                                # same on every host
+    python -m triage.distributed coordinator --address 0.0.0.0:8766 --shards 8
+    python -m triage.distributed worker --coordinator host:8766      # on each host
+
+Every request carries the shared TRIAGE_COORDINATOR_TOKEN; the coordinator
+refuses to listen on a non-loopback address without one. The token only
+authenticates, traffic is not encrypted, so keep it on a trusted network.
+
+`coordinator --local-workers N` also spawns N workers on this box.
+Every worker host needs the same checkout as the coordinator.
+"""
+from __future__ import annotations
+
+import argparse
+import hmac
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from statistics import median
+from typing import Any, Dict, List, Optional, Tuple
+
+from triage.collect import PytestResult, _run, collect_all_tests, extract_durations, extract_failed_tests
+from triage.storage import load_duration_history
+
+DEFAULT_COORDINATOR = "127.0.0.1:8766"
+
+def _parse_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+def _token() -> str:
+    return os.getenv("TRIAGE_COORDINATOR_TOKEN", "")
+
+def _clean_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    # Only the fields a worker legitimately reports; nothing else is trusted.
+    durations = result.get("durations") or {}
+    return {
+        "return_code": int(result["return_code"]),
+        "raw_output": str(result["raw_output"]),
+        "durations": {str(t): float(d) for t, d in durations.items()},
+    }
+
+def make_shards(tests: List[str], n_shards: int, durations: Optional[Dict[str, float]] = None) -> List[List[str]]:
+    """
+    Split nodeids into at most `n_shards` shards, longest-first onto the
+    currently lightest shard. Tests without a recorded duration count as the
+    median known duration (or 1.0 when nothing is known).
+    """
+    durations = durations or {}
+    default = median(durations.values()) if durations else 1.0
+    shards: List[List[str]] = [[] for _ in range(max(1, min(n_shards, len(tests))))]
+    loads = [0.0] * len(shards)
+    for t in sorted(tests, key=lambda t: -durations.get(t, default)):
+        i = loads.index(min(loads))
+        shards[i].append(t)
+        loads[i] += durations.get(t, default)
+    # Keep each shard in collection order so output reads like a local run.
+    order = {t: i for i, t in enumerate(tests)}
+    return [sorted(s, key=order.__getitem__) for s in shards if s]
+
+def _recent_durations(window: int = 5) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for run in reversed(load_duration_history(window=window)):  # newest wins
+        for t, d in zip(run["tests"], run["durations"]):
+            if d == d:  # skip NaN
+                out[t] = float(d)
+    return out
+
+class ShardQueue:
+    """
+    In-memory lease queue. Each shard is pending, leased (one or more active
+    leases with deadlines) or done. Thread-safe; all methods take the lock.
+    """
+
+    def __init__(
+        self,
+        shards: List[List[str]],
+        lease_seconds: float = 60.0,
+        max_attempts: int = 3,
+        speculate_factor: float = 2.0,
+        min_speculate_seconds: float = 5.0,
+    ):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.speculate_factor = speculate_factor
+        self.min_speculate_seconds = min_speculate_seconds
+        self.shards: List[Dict[str, Any]] = [
+            {"tests": s, "leases": {}, "granted": set(), "attempts": 0, "result": None} for s in shards
+        ]
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._durations: List[float] = []
+        if not shards:
+            self._done.set()
+
+    def _expire(self, now: float) -> None:
+        for sid, sh in enumerate(self.shards):
+            if sh["result"] is not None:
+                continue
+            for lid in [l for l, info in sh["leases"].items() if info["deadline"] < now]:
+                del sh["leases"][lid]
+            if not sh["leases"] and sh["attempts"] >= self.max_attempts:
+                self._abandon(sid, f"abandoned after {sh['attempts']} expired leases")
+
+    def _abandon(self, sid: int, why: str) -> None:
+        # Its tests never ran: merge_results drops them from all_tests
+        # so they aren't recorded as passes, and the run is marked failed.
+        tests = self.shards[sid]["tests"]
+        self._finish(sid, {
+            "return_code": 3,
+            "raw_output": (
+                f"INCOMPLETE RUN: shard {sid} {why}; "
+                f"{len(tests)} tests were not run:\n" + "\n".join(tests)
+            ),
+            "durations": {},
+            "abandoned": True,
+            "tests": tests,
+        })
+
+    def _finish(self, sid: int, result: Dict[str, Any]) -> None:
+        self.shards[sid]["result"] = result
+        self.shards[sid]["leases"].clear()
+        if all(sh["result"] is not None for sh in self.shards):
+            self._done.set()
+
+    def _grant(self, sid: int, worker: str, now: float) -> Dict[str, Any]:
+        sh = self.shards[sid]
+        lid = uuid.uuid4().hex
+        sh["leases"][lid] = {"worker": worker, "deadline": now + self.lease_seconds, "started": now}
+        sh["granted"].add(lid)
+        sh["attempts"] += 1
+        return {"shard": sid, "lease": lid, "tests": sh["tests"], "lease_seconds": self.lease_seconds}
+
+    def lease(self, worker: str) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            if self._done.is_set():
+                return {"done": True}
+
+            for sid, sh in enumerate(self.shards):
+                if sh["result"] is None and not sh["leases"]:
+                    return self._grant(sid, worker, now)
+
+            # Nothing pending: duplicate the slowest straggler this worker isn't already on.
+            typical = median(self._durations) if self._durations else 0.0
+            cutoff = max(self.speculate_factor * typical, self.min_speculate_seconds)
+            stragglers = []
+            for sid, sh in enumerate(self.shards):
+                if sh["result"] is not None or len(sh["leases"]) > 1:
+                    continue
+                if any(info["worker"] == worker for info in sh["leases"].values()):
+                    continue
+                started = min(info["started"] for info in sh["leases"].values())
+                if now - started > cutoff:
+                    stragglers.append((started, sid))
+            if stragglers:
+                return self._grant(min(stragglers)[1], worker, now)
+            return {"wait": True}
+
+    def heartbeat(self, sid: int, lid: str) -> bool:
+        with self._lock:
+            info = self.shards[sid]["leases"].get(lid)
+            if info is None:
+                return False
+            info["deadline"] = time.monotonic() + self.lease_seconds
+            return True
+
+    def complete(self, sid: int, lid: str, result: Dict[str, Any]) -> bool:
+        """
+        Record a shard result. The first completion wins; late duplicates (or
+        completions for an already-expired lease after the shard finished)
+        are ignored, as are leases this queue never granted.
+        """
+        with self._lock:
+            sh = self.shards[sid]
+            if sh["result"] is not None or lid not in sh["granted"]:
+                return False
+            info = sh["leases"].get(lid)
+            if info is not None:
+                self._durations.append(time.monotonic() - info["started"])
+            self._finish(sid, result)
+            return True
+
+    def expire(self) -> None:
+        """Drop overdue leases (abandoning exhausted shards) without a worker poll."""
+        with self._lock:
+            self._expire(time.monotonic())
+
+    def abandon_unfinished(self, why: str) -> None:
+        with self._lock:
+            for sid, sh in enumerate(self.shards):
+                if sh["result"] is None:
+                    self._abandon(sid, why)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def results(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [sh["result"] for sh in self.shards]
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        q: ShardQueue = self.server.queue  # type: ignore[attr-defined]
+        token: str = self.server.token  # type: ignore[attr-defined]
+        try:
+            req = json.loads(self.rfile.readline() or b"{}")
+            if token and not hmac.compare_digest(str(req.get("token", "")), token):
+                resp = {"error": "unauthorized"}
+            elif req.get("op") == "lease":
+                resp = q.lease(str(req.get("worker", "?")))
+            elif req.get("op") == "heartbeat":
+                resp = {"ok": q.heartbeat(int(req["shard"]), str(req["lease"]))}
+            elif req.get("op") == "complete":
+                resp = {"ok": q.complete(int(req["shard"]), str(req["lease"]), _clean_result(req["result"]))}
+            else:
+                resp = {"error": f"unknown op {req.get('op')!r}"}
+        except (ValueError, KeyError, TypeError, IndexError, AttributeError) as e:
+            resp = {"error": f"bad request: {e}"}
+        self.wfile.write((json.dumps(resp) + "\n").encode("utf-8"))
+
+class CoordinatorServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address: str, queue: ShardQueue, token: Optional[str] = None):
+        self.queue = queue
+        self.token = _token() if token is None else token
+        host, port = _parse_address(address)
+        if not self.token and host not in ("127.0.0.1", "localhost", "::1"):
+            raise ValueError(f"refusing to listen on {host} without TRIAGE_COORDINATOR_TOKEN")
+        super().__init__((host, port), _Handler)
+
+def merge_results(all_tests: List[str], results: List[Dict[str, Any]]) -> PytestResult:
+    """
+    Fold per-shard results (in shard order) into one PytestResult, with the
+    same return-code semantics as a single pytest invocation.
+
+    Tests of abandoned shards never ran, so they are left out of all_tests
+    (neither pass nor fail) and the run is reported as not ok (exit 3).
+    """
+    not_run = {t for r in results if r.get("abandoned") for t in r.get("tests", [])}
+    rcs = [int(r["return_code"]) for r in results]
+    # pytest exit 5 == "no tests collected" for that shard; it doesn't fail the run.
+    effective = [rc for rc in rcs if rc != 5] or [5]
+    if all(rc == 0 for rc in effective):
+        rc = 0
+    elif all(rc in (0, 1) for rc in effective):
+        rc = 1
+    else:
+        rc = max(effective)
+    raw = "\n".join(r["raw_output"] for r in results)
+    durations: Dict[str, float] = {}
+    for r in results:
+        durations.update(r.get("durations") or {})
+    return PytestResult(
+        ok=(rc == 0),
+        raw_output=raw,
+        return_code=rc,
+        all_tests=[t for t in all_tests if t not in not_run] if not_run else all_tests,
+        failed_tests=extract_failed_tests(raw),
+        durations=durations,
+    )
+
+def spawn_local_workers(n: int, coordinator: str) -> List[subprocess.Popen]:
+    return [
+        subprocess.Popen([sys.executable, "-m", "triage.distributed", "worker", "--coordinator", coordinator])
+        for _ in range(n)
+    ]
+
+def run_pytest_distributed(
+    address: str = DEFAULT_COORDINATOR,
+    n_shards: int = 8,
+    lease_seconds: float = 60.0,
+    local_workers: int = 0,
+    timeout: Optional[float] = None,
+) -> PytestResult:
+    """
+    Coordinator side of a distributed run: collect, shard, serve the queue on
+    `address` until every shard has a result, then merge.
+
+    Leases are expired from here too, so dead workers are noticed even when
+    nobody polls. Shards still unfinished after `timeout` seconds are
+    abandoned and the run comes back incomplete (exit 3).
+    """
+    all_tests = collect_all_tests()
+    queue = ShardQueue(make_shards(all_tests, n_shards, _recent_durations()), lease_seconds=lease_seconds)
+    procs: List[subprocess.Popen] = []
+    with CoordinatorServer(address, queue) as server:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            procs = spawn_local_workers(local_workers, address)
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                tick = lease_seconds
+                if deadline is not None:
+                    tick = min(tick, max(0.0, deadline - time.monotonic()))
+                if queue.wait(tick):
+                    break
+                queue.expire()
+                if deadline is not None and time.monotonic() >= deadline:
+                    queue.abandon_unfinished(f"not finished within {timeout}s")
+                    break
+            # Keep serving briefly so workers polling for more work see "done".
+            time.sleep(0.5)
+        finally:
+            server.shutdown()
+            for p in procs:
+                try:
+                    p.wait(timeout=lease_seconds)
+                except subprocess.TimeoutExpired:
+                    p.kill()
+    return merge_results(all_tests, queue.results())
+
+def _call(coordinator: str, req: Dict[str, Any], timeout: float = 30.0) -> Dict[str, Any]:
+    req = {**req, "token": _token()}
+    with socket.create_connection(_parse_address(coordinator), timeout=timeout) as sock:
+        sock.sendall((json.dumps(req) + "\n").encode("utf-8"))
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("coordinator closed the connection")
+    return json.loads(line)
+
+def _run_shard(tests: List[str], pytest_worker: Optional[str]) -> Dict[str, Any]:
+    # Nodeids come from the coordinator: never let one be parsed as an option.
+    bad = [t for t in tests if not isinstance(t, str) or t.startswith("-")]
+    if bad:
+        raise ValueError(f"refusing shard with option-like nodeids: {bad[:3]}")
+    fd, junit_path = tempfile.mkstemp(suffix=".xml")
+    os.close(fd)
+    try:
+        rc, raw = _run(["pytest", "-q", f"--junitxml={junit_path}", "--", *tests], worker=pytest_worker)
+        durations = extract_durations(junit_path, tests)
+    finally:
+        os.unlink(junit_path)
+    return {"return_code": rc, "raw_output": raw, "durations": durations}
+
+def _heartbeat(coordinator: str, stop: threading.Event, sid: int, lid: str, lease_seconds: float) -> None:
+    # Bound to one lease via arguments, so a beat that outlives its shard
+    # can't pick up the next lease's state.
+    while not stop.wait(lease_seconds / 3):
+        try:
+            if not _call(coordinator, {"op": "heartbeat", "shard": sid, "lease": lid}).get("ok"):
+                return  # shard done elsewhere or lease lost
+        except OSError:
+            return
+
+def worker_loop(coordinator: str, pytest_worker: Optional[str] = None, poll_seconds: float = 0.5) -> int:
+    """
+    Lease shards from `coordinator` until it reports done (or goes away),
+    heartbeating each lease while its shard runs. Returns shards completed.
+    """
+    name = f"{socket.gethostname()}:{os.getpid()}"
+    completed = 0
+    while True:
+        try:
+            grant = _call(coordinator, {"op": "lease", "worker": name})
+        except OSError:
+            return completed  # coordinator finished and shut down
+        if grant.get("done"):
+            return completed
+        if grant.get("error"):
+            print(f"[worker] coordinator rejected request: {grant['error']}", file=sys.stderr)
+            return completed
+        if grant.get("wait"):
+            time.sleep(poll_seconds)
+            continue
+
+        sid, lid = grant["shard"], grant["lease"]
+        stop = threading.Event()
+        beat = threading.Thread(
+            target=_heartbeat, args=(coordinator, stop, sid, lid, grant["lease_seconds"]), daemon=True
+        )
+        beat.start()
+        try:
+            result = _run_shard(grant["tests"], pytest_worker)
+        except ValueError as e:
+            print(f"[worker] {e}", file=sys.stderr)
+            return completed
+        finally:
+            stop.set()
+        try:
+            if _call(coordinator, {"op": "complete", "shard": sid, "lease": lid, "result": result}).get("ok"):
+                completed += 1
+        except OSError:
+            return completed
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Distributed pytest coordinator/worker")
+    sub = ap.add_subparsers(dest="role", required=True)
+
+    c = sub.add_parser("coordinator", help="shard the suite, run triage on the merged result")
+    c.add_argument("--address", default=os.getenv("TRIAGE_COORDINATOR") or DEFAULT_COORDINATOR)
+    c.add_argument("--shards", type=int, default=8)
+    c.add_argument("--lease-seconds", type=float, default=60.0)
+    c.add_argument("--local-workers", type=int, default=0, help="also spawn N workers on this host")
+    c.add_argument("--timeout", type=float, default=None, help="give up on unfinished shards after N seconds")
+
+    w = sub.add_parser("worker", help="pull and run shards from a coordinator")
+    w.add_argument("--coordinator", default=os.getenv("TRIAGE_COORDINATOR") or DEFAULT_COORDINATOR)
+    w.add_argument("--pytest-worker", default=os.getenv("TRIAGE_WORKER"), help="warm worker (triage.worker) to run shards on")
+
+    ns = ap.parse_args(argv)
+    if ns.role == "worker":
+        worker_loop(ns.coordinator, pytest_worker=ns.pytest_worker)
+        return 0
+
+    from triage.run_and_triage import run_once
+
+    return run_once(distributed={
+        "address": ns.address,
+        "n_shards": ns.shards,
+        "lease_seconds": ns.lease_seconds,
+        "local_workers": ns.local_workers,
+        "timeout": ns.timeout,
+    })
+
+if __name__ == "__main__":
+    raise SystemExit(main())
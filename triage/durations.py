@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import math
+from statistics import median
+from typing import Any, Dict, List, Optional
+
+from triage.storage import load_duration_history
+
+def _series_by_test(history: List[Dict[str, Any]]) -> Dict[str, List[float]]:
+    # test -> durations (seconds), newest first, skipping runs where it didn't execute
+    series: Dict[str, List[float]] = {}
+    for run in history:
+        for t, d in zip(run["tests"], run["durations"]):
+            if not math.isnan(d):
+                series.setdefault(t, []).append(d)
+    return series
+
+def _check(
+    test: str,
+    current: float,
+    baseline: List[float],
+    min_samples: int,
+    z_threshold: float,
+    min_ratio: float,
+    min_delta: float,
+) -> Optional[Dict[str, Any]]:
+    """
+    Robust z-score of `current` against the baseline (median / MAD), so a
+    single earlier outlier can't mask or fake a regression. All three gates
+    (z, ratio, absolute delta) must pass to avoid flagging sub-ms jitter.
+    """
+    if len(baseline) < min_samples:
+        return None
+    med = median(baseline)
+    mad = median(abs(x - med) for x in baseline)
+    # MAD is 0 for perfectly stable tests; floor the scale at 1% of median / 1 ms.
+    scale = max(1.4826 * mad, 0.01 * med, 0.001)
+    z = (current - med) / scale
+    delta = current - med
+    ratio = current / med if med > 0 else math.inf
+    if z < z_threshold or ratio < min_ratio or delta < min_delta:
+        return None
+    return {
+        "test": test,
+        "duration": round(current, 3),
+        "baseline_median": round(med, 3),
+        "delta": round(delta, 3),
+        "ratio": round(ratio, 2) if math.isfinite(ratio) else None,
+        "z": round(z, 1),
+        "samples": len(baseline),
+    }
+
+def detect_duration_regressions(
+    current: Dict[str, float],
+    window: int = 20,
+    min_samples: int = 5,
+    z_threshold: float = 4.0,
+    min_ratio: float = 1.5,
+    min_delta: float = 0.1,
+    history: Optional[List[Dict[str, Any]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Flag tests whose duration in `current` (nodeid -> seconds) is a significant
+    slowdown against their rolling baseline over the last `window` stored runs.
+
+    Returns list of regressions, biggest absolute slowdown first:
+      {test, duration, baseline_median, delta, ratio, z, samples}
+    """
+    if history is None:
+        history = load_duration_history(window=window)
+    series = _series_by_test(history)
+    out = []
+    for t, d in current.items():
+        r = _check(t, d, series.get(t, []), min_samples, z_threshold, min_ratio, min_delta)
+        if r:
+            out.append(r)
+    return sorted(out, key=lambda r: -r["delta"])
+
+def duration_report(window: int = 20, limit: int = 25) -> Dict[str, Any]:
+    """
+    Dashboard/API view over stored durations:
+    - slowest: tests with the longest duration in the latest run
+    - regressed: latest run checked against the `window` runs before it
+    """
+    history = load_duration_history(window=window + 1)
+    if not history:
+        return {"run_id": None, "slowest": [], "regressed": []}
+
+    latest, previous = history[0], history[1:]
+    current = {t: d for t, d in zip(latest["tests"], latest["durations"]) if not math.isnan(d)}
+    series = _series_by_test(previous)
+
+    slowest = []
+    for t, d in sorted(current.items(), key=lambda x: -x[1])[:limit]:
+        base = series.get(t)
+        slowest.append({
+            "test": t,
+            "duration": round(d, 3),
+            "baseline_median": round(median(base), 3) if base else None,
+        })
+
+    regressed = detect_duration_regressions(current, history=previous)[:limit]
+    return {"run_id": latest["run_id"], "slowest": slowest, "regressed": regressed}
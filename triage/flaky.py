@@ -0,0 +1,193 @@
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass
+from operator import mul
+from typing import Any, Dict, List
+
+from triage.storage import load_outcome_history
+
+@dataclass
+class OutcomeMatrix:
+    """
+    Bit-packed run x test outcome matrix.
+
+    Each test owns two Python ints used as bitsets over the run axis, where
+    bit i is the i-th most recent run (bit 0 == newest):
+      - present[j]: test j was collected in run i
+      - failed[j]:  test j failed in run i
+    Bitwise ops on these ints process a whole window of runs per call, which
+    is what keeps the per-test metrics cheap on long windows.
+    """
+    run_ids: List[int]
+    tests: List[str]
+    present: List[int]
+    failed: List[int]
+
+    @property
+    def n_runs(self) -> int:
+        return len(self.run_ids)
+
+def load_matrix(window: int = 30) -> OutcomeMatrix:
+    hist = load_outcome_history(window=window)
+
+    index: Dict[str, int] = {}
+    tests: List[str] = []
+    present: List[int] = []
+    failed: List[int] = []
+
+    def _col(t: str) -> int:
+        j = index.get(t)
+        if j is None:
+            j = index[t] = len(tests)
+            tests.append(t)
+            present.append(0)
+            failed.append(0)
+        return j
+
+    # Walk collections oldest -> newest, tracking the oldest run index since
+    # each test has been continuously collected; a removal closes the span
+    # into its presence mask. Cost is O(tests + changed tests), not per run.
+    def _span(start: int, stop: int) -> int:
+        # bits stop..start inclusive (start is the older, higher index)
+        return ((1 << (start + 1)) - 1) ^ ((1 << stop) - 1)
+
+    open_since = dict.fromkeys(hist["base"], len(hist["run_ids"]) - 1)
+    for i, added, removed in hist["transitions"]:
+        for t in removed:
+            start = open_since.pop(t, None)
+            if start is not None:
+                present[_col(t)] |= _span(start, i + 1)
+        for t in added:
+            open_since.setdefault(t, i)
+    for t, start in open_since.items():
+        present[_col(t)] |= _span(start, 0)
+
+    for i, failed_tests in hist["failures"]:
+        bit = 1 << i
+        for t in failed_tests:
+            j = _col(t)
+            failed[j] |= bit
+            # A failed test was executed even if collection missed it.
+            present[j] |= bit
+
+    return OutcomeMatrix(run_ids=hist["run_ids"], tests=tests, present=present, failed=failed)
+
+def _byte_weights(decay: float) -> List[float]:
+    # Weighted popcount of a single byte: sum(decay**j for each set bit j).
+    table = [0.0] * 256
+    for b in range(1, 256):
+        low = b & -b
+        table[b] = table[b ^ low] + decay ** (low.bit_length() - 1)
+    return table
+
+def _decayed_count(mask: int, table: List[float], block_weights: List[float]) -> float:
+    # sum(decay**i for each set bit i), done 8 runs at a time via the byte table.
+    # Runs past len(block_weights) bytes weigh < 1e-12 and are dropped.
+    if not mask:
+        return 0.0
+    n_bytes = len(block_weights)
+    mask &= (1 << (8 * n_bytes)) - 1
+    return sum(map(mul, map(table.__getitem__, mask.to_bytes(n_bytes, "little")), block_weights))
+
+def _longest_streak(mask: int) -> int:
+    # Longest run of set bits in O(log n) bigint ops: double the run length
+    # while some run survives, then binary-search the remainder.
+    if not mask:
+        return 0
+    powers = [(1, mask)]
+    while True:
+        k, c = powers[-1]
+        nxt = c & (c >> k)
+        if not nxt:
+            break
+        powers.append((2 * k, nxt))
+    n, cur = powers.pop()
+    for k, c in reversed(powers):
+        trial = cur & (c >> n)
+        if trial:
+            cur = trial
+            n += k
+    return n
+
+def _wilson_interval(fails: int, total: int, z: float = 1.96) -> List[float]:
+    if total == 0:
+        return [0.0, 1.0]
+    p = fails / total
+    denom = 1 + z * z / total
+    center = (p + z * z / (2 * total)) / denom
+    half = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denom
+    return [round(max(0.0, center - half), 3), round(min(1.0, center + half), 3)]
+
+def analyze_flaky(
+    window: int = 30,
+    min_occurrences: int = 3,
+    half_life: float = 10.0,
+    min_flip_rate: float = 0.0,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Flaky analysis over the last `window` runs using a bit-packed outcome matrix.
+
+    Per test, counting only runs where the test was present: collected in
+    that run, or failed in it. A failure counts even if that run's collection
+    missed the test (v1 skipped such runs).
+    - runs / fails / passes: runs where the test was present / failed / passed
+    - fail_rate: fails / runs
+    - flip_rate: pass<->fail transitions over adjacent runs where the test ran
+    - max_fail_streak / current_fail_streak: consecutive failing runs
+      (current counts back from the newest run)
+    - decayed_fail_rate: fail rate with run weights halving every `half_life` runs
+    - fail_rate_ci: 95% Wilson interval on fail_rate
+    - is_flaky: BOTH passes and failures, runs >= min_occurrences and
+      flip_rate >= min_flip_rate
+
+    Returns dict: test_nodeid -> stats.
+    """
+    m = load_matrix(window=window)
+    decay = 0.5 ** (1.0 / half_life) if half_life > 0 else 0.0
+    table = _byte_weights(decay)
+    block = decay ** 8
+    block_weights = []
+    for k in range((m.n_runs + 7) // 8):
+        w = block ** k
+        if block_weights and w < 1e-12:
+            break
+        block_weights.append(w)
+    # Most tests share one presence mask (same collection every run).
+    present_weight: Dict[int, float] = {}
+
+    stats: Dict[str, Dict[str, Any]] = {}
+    for t, pres, fail in zip(m.tests, m.present, m.failed):
+        total = pres.bit_count()
+        if total == 0:
+            continue
+        fails = fail.bit_count()
+        passes = total - fails
+
+        adjacent = pres & (pres >> 1)
+        pairs = adjacent.bit_count()
+        flips = ((fail ^ (fail >> 1)) & adjacent).bit_count()
+        flip_rate = flips / pairs if pairs else 0.0
+
+        w_total = present_weight.get(pres)
+        if w_total is None:
+            w_total = present_weight[pres] = _decayed_count(pres, table, block_weights)
+        w_fails = _decayed_count(fail, table, block_weights)
+        decayed = w_fails / w_total if w_total else 0.0
+
+        is_flaky = (
+            total >= min_occurrences and fails > 0 and passes > 0 and flip_rate >= min_flip_rate
+        )
+        stats[t] = {
+            "runs": total,
+            "fails": fails,
+            "passes": passes,
+            "fail_rate": round(fails / total, 3),
+            "flip_rate": round(flip_rate, 3),
+            "max_fail_streak": _longest_streak(fail),
+            "current_fail_streak": (fail ^ (fail + 1)).bit_length() - 1,
+            "decayed_fail_rate": round(decayed, 3),
+            "fail_rate_ci": _wilson_interval(fails, total),
+            "is_flaky": is_flaky,
+        }
+    return stats
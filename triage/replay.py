@@ -0,0 +1,237 @@
+"""
+Batch re-triage ("replay") of stored runs, for comparing triage engines.
+
+Engines are re-run over the raw_output of historical failed runs:
+- CPU-bound engines (rules) run in a process pool
+- I/O-bound engines (LLM backends, the local stub) run as asyncio tasks
+  under a concurrency limit
+
+Results go to the triage_replays table, keyed by (job, engine, run), never to
+runs.triage_json. Each batch is committed as it finishes, so re-running the
+same job resumes where it stopped (and retries runs that errored).
+
+    python -m triage.replay --job rules-vs-stub --engines rules,stub
+    python -m triage.replay --job rules-vs-stub --report-only
+
+Engines are a built-in name (rules, llm, stub) or "package.module:function",
+optionally suffixed with "@process" or "@async" (default async).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import importlib
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from statistics import mean, median
+from typing import Any, Callable, Dict, List, Optional
+
+from triage.storage import (
+    insert_replay_session,
+    insert_replays,
+    iter_failed_run_outputs,
+    load_replays,
+    replayed_run_ids,
+)
+
+ENGINES = {
+    "rules": "triage.decision:analyze_with_rules@process",
+    "llm": "triage.decision:analyze_with_openai@async",
+    "stub": "triage.decision:analyze_with_stub@async",
+}
+
+@dataclass
+class EngineSpec:
+    name: str
+    ref: str  # "module:function"
+    mode: str  # "process" | "async"
+
+def parse_engine(spec: str) -> EngineSpec:
+    name = spec
+    full = ENGINES.get(spec, spec)
+    ref, _, mode = full.partition("@")
+    if ":" not in ref:
+        raise ValueError(f"unknown engine {spec!r}: use one of {sorted(ENGINES)} or module:function")
+    mode = mode or "async"
+    if mode not in ("process", "async"):
+        raise ValueError(f"engine {spec!r}: mode must be 'process' or 'async'")
+    return EngineSpec(name=name, ref=ref, mode=mode)
+
+def _load(ref: str) -> Callable[[str], Dict[str, Any]]:
+    module, _, func = ref.partition(":")
+    return getattr(importlib.import_module(module), func)
+
+def _timed(ref: str, run_id: int, raw_output: str) -> Dict[str, Any]:
+    # Top-level (picklable) so process-pool workers can run it.
+    t0 = time.perf_counter()
+    try:
+        triage, error = _load(ref)(raw_output), None
+    except Exception as e:
+        triage, error = None, f"{type(e).__name__}: {e}"
+    return {
+        "run_id": run_id,
+        "triage": triage,
+        "error": error,
+        "latency_ms": (time.perf_counter() - t0) * 1000.0,
+    }
+
+def _replay_process(
+    engine: EngineSpec, batches, done: set, workers: Optional[int], job: str
+) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for rows in batches:
+            todo = [(rid, raw) for rid, raw in rows if rid not in done]
+            if not todo:
+                continue
+            chunk = max(1, len(todo) // ((workers or 4) * 4))
+            results = list(pool.map(_timed, [engine.ref] * len(todo), *zip(*todo), chunksize=chunk))
+            insert_replays(job, engine.name, results)
+            out.extend(results)
+    return out
+
+async def _replay_async(
+    engine: EngineSpec, batches, done: set, concurrency: int, job: str
+) -> List[Dict[str, Any]]:
+    sem = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    # Engines are sync (blocking SDK calls); a dedicated pool sized to the
+    # limit keeps the loop free. The default executor would cap it at
+    # min(32, cpu + 4) threads.
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+
+    async def one(rid: int, raw: str) -> Dict[str, Any]:
+        async with sem:
+            return await loop.run_in_executor(pool, _timed, engine.ref, rid, raw)
+
+    out: List[Dict[str, Any]] = []
+    try:
+        for rows in batches:
+            todo = [(rid, raw) for rid, raw in rows if rid not in done]
+            if not todo:
+                continue
+            results = await asyncio.gather(*(one(rid, raw) for rid, raw in todo))
+            insert_replays(job, engine.name, results)
+            out.extend(results)
+    finally:
+        pool.shutdown(wait=True)
+    return out
+
+def run_replay(
+    job: str,
+    engines: List[str],
+    limit: Optional[int] = None,
+    workers: Optional[int] = None,
+    concurrency: int = 8,
+    batch_size: int = 200,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Replay each engine over stored failed runs for `job`, skipping runs the
+    job already has results for. Returns per-engine session stats:
+    {engine: {succeeded, errors, wall_seconds, throughput_per_s}}, where
+    throughput counts successful calls only.
+    """
+    stats: Dict[str, Dict[str, Any]] = {}
+    for spec in engines:
+        engine = parse_engine(spec)
+        done = replayed_run_ids(job, engine.name)
+        batches = iter_failed_run_outputs(batch_size=batch_size, limit=limit)
+        started_at = datetime.now(timezone.utc).isoformat()
+        t0 = time.perf_counter()
+        if engine.mode == "process":
+            results = _replay_process(engine, batches, done, workers, job)
+        else:
+            results = asyncio.run(_replay_async(engine, batches, done, concurrency, job))
+        wall = time.perf_counter() - t0
+        errors = sum(1 for r in results if r["error"])
+        ok = len(results) - errors
+        insert_replay_session(job, engine.name, started_at, ok, errors, wall)
+        stats[engine.name] = {
+            "succeeded": ok,
+            "errors": errors,
+            "wall_seconds": round(wall, 3),
+            "throughput_per_s": round(ok / wall, 2) if wall > 0 and ok else 0.0,
+        }
+    return stats
+
+def _pct(values: List[float], q: float) -> float:
+    s = sorted(values)
+    return s[min(len(s) - 1, int(q * len(s)))]
+
+def _agreement(a: Dict[int, Dict[str, Any]], b: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+    common = [rid for rid in a if rid in b]
+    confusion: Dict[str, Dict[str, int]] = {}
+    same_class = same_block = 0
+    for rid in common:
+        ca, cb = a[rid].get("classification", "Unknown"), b[rid].get("classification", "Unknown")
+        confusion.setdefault(ca, {}).setdefault(cb, 0)
+        confusion[ca][cb] += 1
+        same_class += ca == cb
+        same_block += bool(a[rid].get("block_ci")) == bool(b[rid].get("block_ci"))
+    n = len(common)
+    return {
+        "runs": n,
+        "classification_agreement": round(same_class / n, 3) if n else None,
+        "block_ci_agreement": round(same_block / n, 3) if n else None,
+        "confusion": confusion,
+    }
+
+def replay_report(job: str) -> Dict[str, Any]:
+    """
+    Compare engines of a replay job with each other and with the original
+    stored decisions ("original").
+
+    Returns dict:
+      - engines: per engine {runs, errors, latency_ms {mean,p50,p95}, throughput_per_s};
+        runs/latency/throughput cover successful calls only, errors are counted apart
+      - agreement: "a vs b" -> {runs, classification_agreement, block_ci_agreement,
+                                confusion[a_class][b_class]}
+    """
+    data = load_replays(job)
+    decisions: Dict[str, Dict[int, Dict[str, Any]]] = {"original": data["original"]}
+    engines: Dict[str, Any] = {}
+    for name, rows in sorted(data["replays"].items()):
+        lat = [r["latency_ms"] for r in rows.values() if not r["error"]]
+        sess = data["sessions"].get(name) or {}
+        wall = sess.get("wall_seconds") or 0.0
+        engines[name] = {
+            "runs": len(lat),
+            "errors": sum(1 for r in rows.values() if r["error"]),
+            "latency_ms": {
+                "mean": round(mean(lat), 2),
+                "p50": round(median(lat), 2),
+                "p95": round(_pct(lat, 0.95), 2),
+            } if lat else None,
+            "throughput_per_s": round(sess.get("succeeded", 0) / wall, 2) if wall else None,
+        }
+        decisions[name] = {rid: r["triage"] for rid, r in rows.items() if r["triage"] is not None}
+
+    names = list(decisions)
+    agreement = {}
+    for i, a in enumerate(names):
+        for b in names[i + 1:]:
+            agreement[f"{a} vs {b}"] = _agreement(decisions[a], decisions[b])
+    return {"job": job, "engines": engines, "agreement": agreement}
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Replay triage engines over stored runs and compare them")
+    ap.add_argument("--job", required=True, help="job name; re-using it resumes the job")
+    ap.add_argument("--engines", default="rules", help="comma-separated engines (rules, llm, stub, module:function[@process|@async])")
+    ap.add_argument("--limit", type=int, default=None, help="only the N oldest failed runs")
+    ap.add_argument("--workers", type=int, default=None, help="process pool size for @process engines")
+    ap.add_argument("--concurrency", type=int, default=8, help="in-flight calls for @async engines")
+    ap.add_argument("--report-only", action="store_true")
+    ns = ap.parse_args(argv)
+
+    if not ns.report_only:
+        engines = [e.strip() for e in ns.engines.split(",") if e.strip()]
+        session = run_replay(ns.job, engines, limit=ns.limit, workers=ns.workers, concurrency=ns.concurrency)
+        print(json.dumps({"session": session}, indent=2))
+    print(json.dumps(replay_report(ns.job), indent=2, ensure_ascii=False))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
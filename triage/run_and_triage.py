@@ -1,14 +1,27 @@
 from __future__ import annotations
 
 import json
+import os
 from datetime import datetime, timezone
+from typing import Any, Dict, Optional
 from triage.collect import run_pytest
+from triage.durations import detect_duration_regressions
 from triage.decision import analyze_with_openai, analyze_with_rules
-from triage.storage import insert_run, compute_flaky_tests
+from triage.flaky import analyze_flaky
+from triage.storage import insert_run
 
-def run_once() -> int:
-    result = run_pytest()
+def run_once(worker: Optional[str] = None, distributed: Optional[Dict[str, Any]] = None) -> int:
+    if distributed is not None:
+        # Coordinator mode: kwargs for triage.distributed.run_pytest_distributed.
+        from triage.distributed import run_pytest_distributed
+
+        result = run_pytest_distributed(**distributed)
+    else:
+        # TRIAGE_WORKER=host:port routes pytest to a warm worker (python -m triage.worker).
+        result = run_pytest(worker=worker or os.getenv("TRIAGE_WORKER"))
     created_at = datetime.now(timezone.utc).isoformat()
+    # Checked against history before this run is stored, so it isn't its own baseline.
+    slow = detect_duration_regressions(result.durations)
 
     if result.ok:
         triage = {
@@ -18,9 +31,11 @@ def run_once() -> int:
             "confidence": 1.0,
             "reason": "All tests passed."
         }
+        if slow:
+            triage["duration_regressions"] = slow
         run_id = insert_run(
             created_at, True, result.return_code, result.raw_output, triage,
-            all_tests=result.all_tests, failed_tests=result.failed_tests
+            all_tests=result.all_tests, failed_tests=result.failed_tests, durations=result.durations
         )
         print(json.dumps({"run_id": run_id, "ok": True, "triage": triage}, indent=2))
         return 0
@@ -33,15 +48,17 @@ def run_once() -> int:
         triage = analyze_with_rules(result.raw_output)
         triage["engine"] = "rules"
         triage["llm_error"] = str(e)
+    if slow:
+        triage["duration_regressions"] = slow
 
-    # Store run (includes test lists for flaky detection)
+    # Store run (includes test lists for flaky detection and durations)
     run_id = insert_run(
         created_at, False, result.return_code, result.raw_output, triage,
-        all_tests=result.all_tests, failed_tests=result.failed_tests
+        all_tests=result.all_tests, failed_tests=result.failed_tests, durations=result.durations
     )
 
     # Compute flaky stats from history and annotate current run for convenience
-    flaky_stats = compute_flaky_tests(window=30, min_occurrences=3)
+    flaky_stats = analyze_flaky(window=30, min_occurrences=3)
     flaky_failed = [t for t in result.failed_tests if flaky_stats.get(t, {}).get("is_flaky")]
 
     payload = {
@@ -50,6 +67,7 @@ def run_once() -> int:
         "failed_tests": result.failed_tests,
         "triage": triage,
         "flaky_failed_tests": flaky_failed,
+        "flaky_failed_stats": {t: flaky_stats[t] for t in flaky_failed},
     }
     print(json.dumps(payload, indent=2))
 
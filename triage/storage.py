@@ -1,9 +1,12 @@
 from __future__ import annotations
 
+import hashlib
 import json
+import math
 import sqlite3
+from array import array
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 DB_PATH = Path(__file__).resolve().parents[1] / "data" / "triage.db"
 
@@ -16,22 +19,162 @@ CREATE TABLE IF NOT EXISTS runs (
   raw_output TEXT NOT NULL,
   triage_json TEXT NOT NULL,
   all_tests_json TEXT NOT NULL,
-  failed_tests_json TEXT NOT NULL
+  failed_tests_json TEXT NOT NULL,
+  collection_hash TEXT
 );
 
 CREATE INDEX IF NOT EXISTS idx_runs_created_at ON runs(created_at);
+
+-- Per-test durations, packed as float32 seconds aligned to the run's
+-- all_tests_json order (NaN = not executed). ~4 bytes per test per run.
+CREATE TABLE IF NOT EXISTS run_durations (
+  run_id INTEGER PRIMARY KEY REFERENCES runs(id),
+  collection_hash TEXT NOT NULL,
+  durations BLOB NOT NULL
+);
+
+-- Replay results: triage engines re-run over stored raw_output. Kept apart
+-- from runs.triage_json so original decisions are never overwritten; a row
+-- per (job, run, engine) doubles as the resume checkpoint.
+CREATE TABLE IF NOT EXISTS triage_replays (
+  job TEXT NOT NULL,
+  run_id INTEGER NOT NULL REFERENCES runs(id),
+  engine TEXT NOT NULL,
+  triage_json TEXT,
+  error TEXT,
+  latency_ms REAL NOT NULL,
+  PRIMARY KEY (job, engine, run_id)
+);
+
+CREATE TABLE IF NOT EXISTS replay_sessions (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  job TEXT NOT NULL,
+  engine TEXT NOT NULL,
+  started_at TEXT NOT NULL,
+  succeeded INTEGER NOT NULL,
+  errors INTEGER NOT NULL DEFAULT 0,
+  wall_seconds REAL NOT NULL
+);
+"""
+
+# Covering index for flaky analysis: lets it group runs by collection and read
+# failures without touching the (large) raw_output/all_tests_json columns.
+OUTCOME_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_runs_outcomes ON runs(id, collection_hash, failed_tests_json);
+"""
+
+# Test-list changes between consecutive collections, so flaky analysis can
+# walk history by deltas instead of parsing every distinct all_tests_json.
+DELTA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS collection_deltas (
+  from_hash TEXT NOT NULL,
+  to_hash TEXT NOT NULL,
+  added_json TEXT NOT NULL,
+  removed_json TEXT NOT NULL,
+  PRIMARY KEY (from_hash, to_hash)
+);
+"""
+
+# Full-text search over raw output, triage decision text and failed test names.
+# External-content FTS5 backed by a view, so raw_output isn't stored twice;
+# the index is updated in insert_run and backfilled once by init_db.
+SEARCH_SCHEMA = """
+CREATE VIEW IF NOT EXISTS runs_search_content AS
+SELECT
+  id,
+  raw_output,
+  coalesce(json_extract(triage_json, '$.reason'), '') || ' ' ||
+    coalesce(json_extract(triage_json, '$.root_cause_summary'), '') AS decision,
+  failed_tests_json AS failed_tests
+FROM runs;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS runs_fts USING fts5(
+  raw_output, decision, failed_tests,
+  content='runs_search_content', content_rowid='id'
+);
 """
 
+# Markers wrapped around matched terms in search snippets (callers render them).
+MARK_START = "\x02"
+MARK_END = "\x03"
+
 def _connect() -> sqlite3.Connection:
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
     conn = sqlite3.connect(str(DB_PATH))
     conn.execute("PRAGMA journal_mode=WAL;")
     return conn
 
+def _collection_hash(all_tests_json: str) -> str:
+    return hashlib.sha1(all_tests_json.encode("utf-8")).hexdigest()
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(runs)")}
+    if "collection_hash" not in cols:
+        conn.execute("ALTER TABLE runs ADD COLUMN collection_hash TEXT")
+        conn.create_function("collection_hash", 1, _collection_hash)
+        conn.execute("UPDATE runs SET collection_hash = collection_hash(all_tests_json)")
+    has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'runs_fts'").fetchone()
+    if not has_fts:
+        conn.executescript(SEARCH_SCHEMA)
+        conn.execute("INSERT INTO runs_fts(runs_fts) VALUES ('rebuild')")
+
+def _tests_of_run(cur: sqlite3.Cursor, run_id: int) -> List[str]:
+    cur.execute("SELECT all_tests_json FROM runs WHERE id = ?", (run_id,))
+    return json.loads(cur.fetchone()[0])
+
+def _record_delta(cur: sqlite3.Cursor, from_hash: str, from_tests: List[str], to_hash: str, to_tests: List[str]) -> None:
+    old, new = set(from_tests), set(to_tests)
+    cur.execute(
+        "INSERT OR IGNORE INTO collection_deltas(from_hash, to_hash, added_json, removed_json) VALUES (?, ?, ?, ?)",
+        (
+            from_hash,
+            to_hash,
+            json.dumps(sorted(new - old), ensure_ascii=False),
+            json.dumps(sorted(old - new), ensure_ascii=False),
+        ),
+    )
+
+def _collection_delta(
+    cur: sqlite3.Cursor, from_hash: str, from_run: int, to_hash: str, to_run: int
+) -> Tuple[List[str], List[str]]:
+    """(added, removed) going from one collection to another; computed and stored if missing."""
+    cur.execute(
+        "SELECT added_json, removed_json FROM collection_deltas WHERE from_hash = ? AND to_hash = ?",
+        (from_hash, to_hash),
+    )
+    row = cur.fetchone()
+    if row is None:
+        _record_delta(cur, from_hash, _tests_of_run(cur, from_run), to_hash, _tests_of_run(cur, to_run))
+        cur.connection.commit()
+        return _collection_delta(cur, from_hash, from_run, to_hash, to_run)
+    return json.loads(row[0]), json.loads(row[1])
+
+def _migrate_deltas(conn: sqlite3.Connection) -> None:
+    has_deltas = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'collection_deltas'").fetchone()
+    if has_deltas:
+        return
+    conn.executescript(DELTA_SCHEMA)
+    cur = conn.cursor()
+    rows = conn.execute("SELECT id, collection_hash FROM runs INDEXED BY idx_runs_outcomes ORDER BY id").fetchall()
+    prev_id, prev_hash, prev_tests = None, None, None
+    for rid, chash in rows:
+        if prev_hash is not None and chash != prev_hash:
+            if prev_tests is None:
+                prev_tests = _tests_of_run(cur, prev_id)
+            tests = _tests_of_run(cur, rid)
+            _record_delta(cur, prev_hash, prev_tests, chash, tests)
+            prev_tests = tests
+        elif chash != prev_hash:
+            prev_tests = None
+        prev_id, prev_hash = rid, chash
+
 def init_db() -> None:
     conn = _connect()
     try:
         conn.executescript(SCHEMA)
+        _migrate(conn)
+        conn.executescript(OUTCOME_INDEX)
+        _migrate_deltas(conn)
         conn.commit()
     finally:
         conn.close()
@@ -44,15 +187,22 @@ def insert_run(
     triage: Dict[str, Any],
     all_tests: List[str],
     failed_tests: List[str],
+    durations: Optional[Dict[str, float]] = None,
 ) -> int:
     init_db()
+    all_tests_json = json.dumps(all_tests, ensure_ascii=False)
+    chash = _collection_hash(all_tests_json)
     conn = _connect()
     try:
         cur = conn.cursor()
+        cur.execute("SELECT id, collection_hash FROM runs INDEXED BY idx_runs_outcomes ORDER BY id DESC LIMIT 1")
+        prev = cur.fetchone()
+        if prev is not None and prev[1] != chash:
+            _record_delta(cur, prev[1], _tests_of_run(cur, prev[0]), chash, all_tests)
         cur.execute(
             """
-            INSERT INTO runs(created_at, ok, return_code, raw_output, triage_json, all_tests_json, failed_tests_json)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO runs(created_at, ok, return_code, raw_output, triage_json, all_tests_json, failed_tests_json, collection_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 created_at,
@@ -60,15 +210,38 @@ def insert_run(
                 int(return_code),
                 raw_output,
                 json.dumps(triage, ensure_ascii=False),
-                json.dumps(all_tests, ensure_ascii=False),
+                all_tests_json,
                 json.dumps(failed_tests, ensure_ascii=False),
+                chash,
             ),
         )
+        run_id = int(cur.lastrowid)
+        cur.execute(
+            """
+            INSERT INTO runs_fts(rowid, raw_output, decision, failed_tests)
+            SELECT id, raw_output, decision, failed_tests FROM runs_search_content WHERE id = ?
+            """,
+            (run_id,),
+        )
+        if durations:
+            cur.execute(
+                "INSERT INTO run_durations(run_id, collection_hash, durations) VALUES (?, ?, ?)",
+                (run_id, chash, pack_durations(all_tests, durations)),
+            )
         conn.commit()
-        return int(cur.lastrowid)
+        return run_id
     finally:
         conn.close()
 
+def pack_durations(all_tests: List[str], durations: Dict[str, float]) -> bytes:
+    nan = math.nan
+    return array("f", [durations.get(t, nan) for t in all_tests]).tobytes()
+
+def unpack_durations(blob: bytes) -> array:
+    out = array("f")
+    out.frombytes(blob)
+    return out
+
 def list_runs(limit: int = 50) -> List[Dict[str, Any]]:
     init_db()
     conn = _connect()
@@ -120,67 +293,258 @@ def get_run(run_id: int) -> Optional[Dict[str, Any]]:
     finally:
         conn.close()
 
-def _recent_runs(window: int = 50) -> List[Dict[str, Any]]:
+def load_outcome_history(window: int = 30) -> Dict[str, Any]:
+    """
+    Load the last `window` runs in a shape suited to bulk flaky analysis.
+
+    Runs are read from the covering outcome index. Only the oldest run's
+    collected-test list is parsed; later collection changes come from
+    `collection_deltas`, so the cost tracks how much the suite changed rather
+    than (distinct collections x tests). Failures are sparse and are returned
+    per run.
+
+    Returns dict:
+      - run_ids: run ids, newest first (index 0 == most recent run)
+      - base: collected tests of the oldest run in the window
+      - transitions: (run_index, added, removed) where the collection changed,
+        oldest first; run_index is the first run with the new collection
+      - failures: list of (run_index, failed_tests)
+    """
+    init_db()
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            """
+            SELECT id, collection_hash, failed_tests_json FROM runs INDEXED BY idx_runs_outcomes
+            ORDER BY id DESC LIMIT ?
+            """,
+            (int(window),),
+        )
+        run_ids: List[int] = []
+        hashes: List[str] = []
+        failures = []
+        for i, (rid, chash, failj) in enumerate(cur.fetchall()):
+            run_ids.append(rid)
+            hashes.append(chash)
+            if failj != "[]":
+                failures.append((i, json.loads(failj)))
+        if not run_ids:
+            return {"run_ids": run_ids, "base": [], "transitions": [], "failures": failures}
+
+        base = _tests_of_run(cur, run_ids[-1])
+        transitions = []
+        for i in range(len(run_ids) - 2, -1, -1):
+            if hashes[i] == hashes[i + 1]:
+                continue
+            added, removed = _collection_delta(cur, hashes[i + 1], run_ids[i + 1], hashes[i], run_ids[i])
+            transitions.append((i, added, removed))
+
+        return {"run_ids": run_ids, "base": base, "transitions": transitions, "failures": failures}
+    finally:
+        conn.close()
+
+def load_duration_history(window: int = 20) -> List[Dict[str, Any]]:
+    """
+    Load packed per-test durations for the last `window` runs that have them.
+
+    Returns list (newest first) of {run_id, tests, durations} where
+    `durations[i]` is the float32 duration of `tests[i]` (NaN if not run).
+    `tests` lists are shared between runs with the same collection.
+    """
     init_db()
     conn = _connect()
     try:
         cur = conn.cursor()
         cur.execute(
-            "SELECT id, created_at, all_tests_json, failed_tests_json FROM runs ORDER BY id DESC LIMIT ?",
+            "SELECT run_id, collection_hash, durations FROM run_durations ORDER BY run_id DESC LIMIT ?",
             (int(window),),
         )
         rows = cur.fetchall()
+        tests_by_hash: Dict[str, List[str]] = {}
         out = []
-        for rid, created_at, allj, failj in rows:
-            out.append(
+        for run_id, chash, blob in rows:
+            tests = tests_by_hash.get(chash)
+            if tests is None:
+                cur.execute("SELECT all_tests_json FROM runs WHERE id = ?", (run_id,))
+                tests = tests_by_hash[chash] = json.loads(cur.fetchone()[0])
+            out.append({"run_id": run_id, "tests": tests, "durations": unpack_durations(blob)})
+        return out
+    finally:
+        conn.close()
+
+def _fts_query(text: str) -> str:
+    # Treat user input as plain terms (each quoted, all required) so characters
+    # like ':' or '(' in error messages aren't parsed as FTS5 syntax.
+    terms = [t.replace('"', '""') for t in (text or "").split()]
+    return " ".join(f'"{t}"' for t in terms)
+
+def search_runs(query: str, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+    """
+    Full-text search over raw output, triage reason/root_cause_summary and
+    failed test names. Results are ranked by bm25 (decision and test-name
+    matches weigh more than raw output) and carry a snippet with matches
+    wrapped in MARK_START/MARK_END.
+
+    Returns dict: {total, results: [{id, created_at, ok, triage, snippet}]}
+    """
+    match = _fts_query(query)
+    if not match:
+        return {"total": 0, "results": []}
+    init_db()
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT count(*) FROM runs_fts WHERE runs_fts MATCH ?", (match,))
+        total = int(cur.fetchone()[0])
+        cur.execute(
+            """
+            SELECT r.id, r.created_at, r.ok, r.triage_json,
+                   snippet(runs_fts, -1, ?, ?, '…', 16)
+            FROM runs_fts JOIN runs r ON r.id = runs_fts.rowid
+            WHERE runs_fts MATCH ?
+            ORDER BY bm25(runs_fts, 1.0, 5.0, 3.0), r.id DESC
+            LIMIT ? OFFSET ?
+            """,
+            (MARK_START, MARK_END, match, int(limit), int(offset)),
+        )
+        results = []
+        for rid, created_at, ok, triage_json, snip in cur.fetchall():
+            results.append(
                 {
                     "id": rid,
                     "created_at": created_at,
-                    "all_tests": json.loads(allj),
-                    "failed_tests": set(json.loads(failj)),
+                    "ok": bool(ok),
+                    "triage": json.loads(triage_json),
+                    "snippet": snip,
                 }
             )
-        return out
+        return {"total": total, "results": results}
     finally:
         conn.close()
 
-def compute_flaky_tests(window: int = 30, min_occurrences: int = 3) -> Dict[str, Dict[str, Any]]:
+def replayed_run_ids(job: str, engine: str) -> set:
+    # Errored rows are not counted as done, so a resumed job retries them.
+    init_db()
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT run_id FROM triage_replays WHERE job = ? AND engine = ? AND error IS NULL", (job, engine))
+        return {rid for (rid,) in cur.fetchall()}
+    finally:
+        conn.close()
+
+def iter_failed_run_outputs(batch_size: int = 200, limit: Optional[int] = None):
     """
-    Very practical flaky heuristic:
-    - Look at last `window` runs
-    - For each test, count pass/fail occurrences (assuming tests executed)
-    - Mark flaky if it has BOTH passes and failures and total >= min_occurrences
+    Yield batches of (run_id, raw_output) for failed runs, oldest first,
+    reading `batch_size` rows at a time so long histories aren't loaded at once.
+    """
+    init_db()
+    last_id, seen = 0, 0
+    while limit is None or seen < limit:
+        n = batch_size if limit is None else min(batch_size, limit - seen)
+        conn = _connect()
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT id, raw_output FROM runs WHERE ok = 0 AND id > ? ORDER BY id LIMIT ?",
+                (last_id, n),
+            )
+            rows = cur.fetchall()
+        finally:
+            conn.close()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        seen += len(rows)
+        yield rows
+
+def insert_replays(job: str, engine: str, rows: List[Dict[str, Any]]) -> None:
+    """rows: [{run_id, triage (dict or None), error (str or None), latency_ms}]"""
+    init_db()
+    conn = _connect()
+    try:
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO triage_replays(job, run_id, engine, triage_json, error, latency_ms)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    job,
+                    int(r["run_id"]),
+                    engine,
+                    json.dumps(r["triage"], ensure_ascii=False) if r.get("triage") is not None else None,
+                    r.get("error"),
+                    float(r["latency_ms"]),
+                )
+                for r in rows
+            ],
+        )
+        conn.commit()
+    finally:
+        conn.close()
 
-    Returns dict: test_nodeid -> {runs, fails, passes, fail_rate, is_flaky}
+def insert_replay_session(
+    job: str, engine: str, started_at: str, succeeded: int, errors: int, wall_seconds: float
+) -> None:
+    init_db()
+    conn = _connect()
+    try:
+        conn.execute(
+            """
+            INSERT INTO replay_sessions(job, engine, started_at, succeeded, errors, wall_seconds)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (job, engine, started_at, int(succeeded), int(errors), float(wall_seconds)),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+def load_replays(job: str) -> Dict[str, Any]:
     """
-    runs = _recent_runs(window=window)
-    # Universe: union of collected tests across runs
-    universe = set()
-    for r in runs:
-        for t in r["all_tests"]:
-            universe.add(t)
-
-    stats: Dict[str, Dict[str, Any]] = {}
-    for t in sorted(universe):
-        total = 0
-        fails = 0
-        for r in runs:
-            # If a run didn't include this test in its collection list, skip it for that run
-            if t not in r["all_tests"]:
-                continue
-            total += 1
-            if t in r["failed_tests"]:
-                fails += 1
-        if total == 0:
-            continue
-        passes = total - fails
-        fail_rate = fails / total if total else 0.0
-        is_flaky = (total >= min_occurrences) and (fails > 0) and (passes > 0)
-        stats[t] = {
-            "runs": total,
-            "fails": fails,
-            "passes": passes,
-            "fail_rate": round(fail_rate, 3),
-            "is_flaky": is_flaky,
+    Everything needed to report on a replay job:
+      - replays: engine -> {run_id: {triage, error, latency_ms}}
+      - original: run_id -> stored triage for the replayed runs
+      - sessions: engine -> {succeeded, errors, wall_seconds}
+    """
+    init_db()
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT engine, run_id, triage_json, error, latency_ms FROM triage_replays WHERE job = ?",
+            (job,),
+        )
+        replays: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        for engine, rid, tj, err, lat in cur.fetchall():
+            replays.setdefault(engine, {})[rid] = {
+                "triage": json.loads(tj) if tj else None,
+                "error": err,
+                "latency_ms": lat,
+            }
+
+        cur.execute(
+            """
+            SELECT id, triage_json FROM runs
+            WHERE id IN (SELECT DISTINCT run_id FROM triage_replays WHERE job = ?)
+            """,
+            (job,),
+        )
+        original = {rid: json.loads(tj) for rid, tj in cur.fetchall()}
+
+        cur.execute(
+            """
+            SELECT engine, sum(succeeded), sum(errors), sum(wall_seconds)
+            FROM replay_sessions WHERE job = ? GROUP BY engine
+            """,
+            (job,),
+        )
+        sessions = {
+            engine: {"succeeded": ok, "errors": err, "wall_seconds": w}
+            for engine, ok, err, w in cur.fetchall()
         }
-    return stats
+        return {"replays": replays, "original": original, "sessions": sessions}
+    finally:
+        conn.close()
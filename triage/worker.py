@@ -0,0 +1,180 @@
+"""
+Warm pytest worker daemon.
+
+A long-lived process imports pytest, plugins, conftest and the test modules
+once (via an in-process --collect-only), then serves each run request from a
+forked child that inherits that warm state. Changes to .py sources or pytest
+config files under the root are detected per request and trigger a re-warm,
+so results never come from stale code or config.
+
+Requests are passed to pytest.main unchecked, so the worker only listens on
+loopback.
+
+    python -m triage.worker --address 127.0.0.1:8765
+
+Clients (triage.collect, the dashboard) point at it with TRIAGE_WORKER.
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+from contextlib import redirect_stderr, redirect_stdout
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+
+# pytest config files: markers, addopts and plugins change what gets warmed.
+_CONFIG_FILES = {"pytest.ini", "pyproject.toml", "setup.cfg", "tox.ini"}
+
+_SKIP_DIRS = {".git", ".venv", "venv", "__pycache__", ".pytest_cache", ".tox", ".nox", "node_modules", "data"}
+
+def worker_address() -> str:
+    return os.getenv("TRIAGE_WORKER") or DEFAULT_ADDRESS
+
+def _parse_address(address: str) -> Tuple[str, int]:
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+def _source_snapshot(root: Path) -> Dict[str, int]:
+    snap: Dict[str, int] = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in _SKIP_DIRS]
+        for name in filenames:
+            if name.endswith(".py") or name in _CONFIG_FILES:
+                p = os.path.join(dirpath, name)
+                try:
+                    snap[p] = os.stat(p).st_mtime_ns
+                except OSError:
+                    continue
+    return snap
+
+def _is_project_file(path: str, root: Path) -> bool:
+    # Only project code is re-imported; installed packages (a .venv inside the
+    # root included) stay warm, and C extensions may not survive a second init.
+    p = Path(path).resolve()
+    if not p.is_relative_to(root):
+        return False
+    return not any(
+        part in _SKIP_DIRS or part in ("site-packages", "dist-packages")
+        for part in p.relative_to(root).parts[:-1]
+    )
+
+class _WarmState:
+    def __init__(self, root: Path):
+        self.root = root
+        self.baseline_modules = set(sys.modules)
+        self.snapshot: Dict[str, int] = {}
+
+    def warm(self) -> None:
+        import pytest
+
+        self.snapshot = _source_snapshot(self.root)
+        # Collection imports conftest + test modules (with assertion rewriting)
+        # into this process; forked children then skip all of it.
+        sink = io.StringIO()
+        with redirect_stdout(sink), redirect_stderr(sink):
+            pytest.main(["--collect-only", "-q", "-p", "no:cacheprovider"])
+
+    def reload_if_changed(self) -> bool:
+        snap = _source_snapshot(self.root)
+        if snap == self.snapshot:
+            return False
+        for name in list(sys.modules):
+            if name in self.baseline_modules:
+                continue
+            f = getattr(sys.modules[name], "__file__", None)
+            if f and _is_project_file(f, self.root):
+                del sys.modules[name]
+        self.warm()
+        return True
+
+def _run_in_child(args: List[str]) -> Tuple[int, str]:
+    """
+    Runs inside the forked child: point fd 1/2 at a temp file so everything
+    pytest (or the code under test) prints is captured like a subprocess.
+    """
+    import pytest
+
+    with tempfile.TemporaryFile(mode="w+b") as out:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(out.fileno(), 1)
+        os.dup2(out.fileno(), 2)
+        try:
+            rc = int(pytest.main(list(args)))
+        except SystemExit as e:
+            rc = e.code if isinstance(e.code, int) else 1
+        sys.stdout.flush()
+        sys.stderr.flush()
+        out.seek(0)
+        return rc, out.read().decode("utf-8", errors="replace")
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        req = json.loads(self.rfile.readline() or b"{}")
+        rc, raw = _run_in_child(req.get("args", []))
+        self.wfile.write((json.dumps({"return_code": rc, "output": raw}) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+class WorkerServer(socketserver.ForkingTCPServer):
+    allow_reuse_address = True
+
+    def __init__(self, address: str, state: _WarmState):
+        self.state = state
+        host, port = _parse_address(address)
+        # Clients choose the pytest args (plugins, output paths), so never expose it.
+        if host not in ("127.0.0.1", "localhost", "::1"):
+            raise ValueError(f"warm worker only listens on loopback, not {host}")
+        super().__init__((host, port), _Handler)
+
+    def process_request(self, request, client_address):
+        # Re-warm in the parent (before forking) so every child sees fresh code.
+        if self.state.reload_if_changed():
+            print("[worker] source/config change detected, reloaded test modules", file=sys.stderr)
+        super().process_request(request, client_address)
+
+def serve(address: str = DEFAULT_ADDRESS, root: Optional[str] = None) -> None:
+    if not hasattr(os, "fork"):
+        raise RuntimeError("warm worker requires os.fork (POSIX only)")
+    root_path = Path(root or os.getcwd()).resolve()
+    os.chdir(root_path)
+    if str(root_path) not in sys.path:
+        sys.path.insert(0, str(root_path))
+
+    state = _WarmState(root_path)
+    state.warm()
+    with WorkerServer(address, state) as server:
+        print(f"[worker] warm, serving pytest on {address} (root {root_path})", file=sys.stderr)
+        server.serve_forever()
+
+def run_remote(args: List[str], address: Optional[str] = None, timeout: Optional[float] = None) -> Tuple[int, str]:
+    """
+    Run `pytest <args>` on the warm worker. Returns (return_code, raw_output),
+    the same shape as triage.collect._run. Raises OSError if unreachable.
+    """
+    with socket.create_connection(_parse_address(address or worker_address()), timeout=timeout) as sock:
+        sock.sendall((json.dumps({"args": list(args)}) + "\n").encode("utf-8"))
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("worker closed the connection without a result")
+    resp = json.loads(line)
+    return int(resp["return_code"]), resp["output"]
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Warm pytest worker daemon")
+    ap.add_argument("--address", default=worker_address(), help="host:port to listen on")
+    ap.add_argument("--root", default=None, help="project root (default: cwd)")
+    ns = ap.parse_args(argv)
+    serve(ns.address, ns.root)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())